@@ -3,17 +3,47 @@ Streamlit frontend for resume screening application.
 """
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
 import os
 from dotenv import load_dotenv
 import plotly.graph_objects as go
-from workflow import process_multiple_resumes
-from langchain_community.document_loaders import PyPDFLoader
-import tempfile
+from workflow import process_multiple_resumes_iter, extract_text_from_bytes
 
 # Load environment variables
 load_dotenv()
 
+
+def to_results_df(results):
+    """Store results column-wise, highest score first."""
+    return pd.DataFrame(results).sort_values("score", ascending=False, ignore_index=True)
+
+
+def build_summary_df(results_df):
+    """Build the candidate summary table from the sorted results DataFrame."""
+    return pd.DataFrame({
+        "Candidate": results_df["candidate"],
+        "Score": results_df["score"],
+        "Status": pd.cut(
+            results_df["score"],
+            bins=[float("-inf"), 50, 70, float("inf")],
+            right=False,
+            labels=["❌ Weak Fit", "⚠️ Moderate Fit", "✅ Strong Fit"]
+        )
+    })
+
+
+# Score stays numeric; the percentage is applied only when rendering
+SUMMARY_COLUMN_CONFIG = {
+    "Score": st.column_config.ProgressColumn(
+        "Score",
+        min_value=0,
+        max_value=100,
+        format="%d%%"
+    )
+}
+
+
 # Page config
 st.set_page_config(
     page_title="AI Resume Screener",
@@ -70,15 +100,8 @@ with st.sidebar:
         if jd_file:
             with st.spinner("Extracting JD from PDF..."):
                 try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                        tmp_file.write(jd_file.read())
-                        tmp_path = tmp_file.name
-                    
-                    loader = PyPDFLoader(tmp_path)
-                    pages = loader.load()
-                    jd_text = "\n".join([page.page_content for page in pages])
+                    jd_text = extract_text_from_bytes(jd_file.read())
                     
-                    os.remove(tmp_path)
                     st.success("✅ JD extracted successfully!")
                     
                 except Exception as e:
@@ -107,14 +130,29 @@ with col1:
         key="resumes"
     )
     
+    uploads = []
+    
     if resume_files:
-        st.success(f"✅ {len(resume_files)} resume(s) uploaded")
+        # Read each file's bytes once; reruns reuse them while the selection is unchanged
+        upload_key = tuple(f.file_id for f in resume_files)
+        cached_key, cached_uploads = st.session_state.get("uploads", (None, []))
+        
+        if cached_key == upload_key:
+            uploads = cached_uploads
+        else:
+            uploads = [(f.name, f.getvalue()) for f in resume_files]
+            st.session_state["uploads"] = (upload_key, uploads)
+        
+        st.success(f"✅ {len(uploads)} resume(s) uploaded")
         
         # Show file names
         with st.expander("View uploaded files"):
-            for idx, file in enumerate(resume_files, 1):
-                file_size = len(file.getvalue()) / (1024 * 1024)  # MB
-                st.write(f"{idx}. {file.name} ({file_size:.2f} MB)")
+            for idx, (file_name, file_bytes) in enumerate(uploads, 1):
+                file_size = len(file_bytes) / (1024 * 1024)  # MB
+                st.write(f"{idx}. {file_name} ({file_size:.2f} MB)")
+    else:
+        # Don't hold the bytes of removed files in the session
+        st.session_state.pop("uploads", None)
 
 with col2:
     st.header("🚀 Actions")
@@ -136,52 +174,64 @@ with col2:
 # Processing
 if screen_button:
     # Validation
-    if len(resume_files) > 10:
+    if len(uploads) > 10:
         st.error("❌ Maximum 10 resumes allowed per session")
-    elif any(len(f.getvalue()) > 5 * 1024 * 1024 for f in resume_files):
+    elif any(len(file_bytes) > 5 * 1024 * 1024 for _, file_bytes in uploads):
         st.error("❌ One or more files exceed 5MB limit")
     else:
-        # Prepare resume data
-        resume_data = [(f.name, f.getvalue()) for f in resume_files]
+        # Process resumes, showing each result as soon as it is ready
+        progress = st.progress(0, text="🔄 Screening resumes...")
+        results_placeholder = st.empty()
+        results = []
         
-        # Process resumes
-        with st.spinner("🔄 Screening resumes... This may take a minute..."):
-            try:
-                results = process_multiple_resumes(jd_text, resume_data)
-                
-                # Store results in session state
-                st.session_state["results"] = results
+        try:
+            for result in process_multiple_resumes_iter(jd_text, uploads):
+                results.append(result)
+                progress.progress(
+                    len(results) / len(uploads),
+                    text=f"🔄 Screened {len(results)}/{len(uploads)} resume(s)"
+                )
+                results_placeholder.dataframe(
+                    build_summary_df(to_results_df(results)),
+                    column_config=SUMMARY_COLUMN_CONFIG,
+                    use_container_width=True,
+                    hide_index=True
+                )
                 
-                st.success(f"✅ Screening complete! Processed {len(results)} resume(s)")
-                
-            except Exception as e:
-                st.error(f"❌ Error during screening: {str(e)}")
-                st.exception(e)
+                if result.get("error"):
+                    st.warning(f"⚠️ {result['candidate']}: {result['error']}")
+            
+            # Store results column-wise so reruns read columns instead of rebuilding
+            st.session_state["results_df"] = to_results_df(results)
+            
+            progress.empty()
+            results_placeholder.empty()
+            st.success(f"✅ Screening complete! Processed {len(results)} resume(s)")
+            
+        except Exception as e:
+            st.error(f"❌ Error during screening: {str(e)}")
+            st.exception(e)
 
 # Display results
-if "results" in st.session_state and st.session_state["results"]:
-    results = st.session_state["results"]
+if "results_df" in st.session_state and not st.session_state["results_df"].empty:
+    results_df = st.session_state["results_df"]
     
     st.divider()
     st.header("📊 Screening Results")
     
-    # Create DataFrame
-    df = pd.DataFrame([
-        {
-            "Candidate": r["candidate"],
-            "Score": f"{r['score']}%",
-            "Status": "✅ Strong Fit" if r["score"] >= 70 else "⚠️ Moderate Fit" if r["score"] >= 50 else "❌ Weak Fit"
-        }
-        for r in results
-    ])
+    # Results are already sorted by score; read chart data column-wise
+    names = results_df["candidate"].tolist()
+    scores = results_df["score"].tolist()
+    colors = ['#00cc66' if s >= 70 else '#ffaa00' if s >= 50 else '#ff4444' for s in scores]
+    labels = [f"{s}%" for s in scores]
     
-    # Sort by score
-    df_sorted = df.sort_values(by="Score", ascending=False, key=lambda x: x.str.rstrip('%').astype(float))
+    df_sorted = build_summary_df(results_df)
     
     # Display table
     st.subheader("📋 Candidate Summary")
     st.dataframe(
         df_sorted,
+        column_config=SUMMARY_COLUMN_CONFIG,
         use_container_width=True,
         hide_index=True
     )
@@ -195,11 +245,10 @@ if "results" in st.session_state and st.session_state["results"]:
         # Bar chart
         fig = go.Figure(data=[
             go.Bar(
-                x=[r["candidate"] for r in sorted(results, key=lambda x: x["score"], reverse=True)],
-                y=[r["score"] for r in sorted(results, key=lambda x: x["score"], reverse=True)],
-                marker_color=['#00cc66' if r["score"] >= 70 else '#ffaa00' if r["score"] >= 50 else '#ff4444' 
-                             for r in sorted(results, key=lambda x: x["score"], reverse=True)],
-                text=[f"{r['score']}%" for r in sorted(results, key=lambda x: x["score"], reverse=True)],
+                x=names,
+                y=scores,
+                marker_color=colors,
+                text=labels,
                 textposition='outside'
             )
         ])
@@ -217,18 +266,17 @@ if "results" in st.session_state and st.session_state["results"]:
     with col2:
         st.subheader("📊 Statistics")
         
-        scores = [r["score"] for r in results]
+        score_arr = results_df["score"].to_numpy()
         
         col_a, col_b, col_c = st.columns(3)
-        col_a.metric("Average", f"{sum(scores)/len(scores):.1f}%")
-        col_b.metric("Highest", f"{max(scores)}%")
-        col_c.metric("Lowest", f"{min(scores)}%")
+        col_a.metric("Average", f"{score_arr.mean():.1f}%")
+        col_b.metric("Highest", f"{score_arr.max()}%")
+        col_c.metric("Lowest", f"{score_arr.min()}%")
         
         st.divider()
         
-        strong = sum(1 for s in scores if s >= 70)
-        moderate = sum(1 for s in scores if 50 <= s < 70)
-        weak = sum(1 for s in scores if s < 50)
+        # Bins are [-inf, 50), [50, 70), [70, inf] -> weak, moderate, strong
+        weak, moderate, strong = np.histogram(score_arr, bins=[-np.inf, 50, 70, np.inf])[0]
         
         st.write("**Fit Distribution:**")
         st.write(f"✅ Strong Fit (≥70%): {strong}")
@@ -239,40 +287,40 @@ if "results" in st.session_state and st.session_state["results"]:
     st.divider()
     st.subheader("📝 Detailed Analysis")
     
-    for idx, result in enumerate(sorted(results, key=lambda x: x["score"], reverse=True), 1):
-        with st.expander(f"#{idx} {result['candidate']} - Score: {result['score']}%"):
+    for idx, result in enumerate(results_df.itertuples(index=False), 1):
+        with st.expander(f"#{idx} {result.candidate} - Score: {result.score}%"):
             
-            if result.get("error"):
-                st.error(f"⚠️ Error: {result['error']}")
+            if result.error:
+                st.error(f"⚠️ Error: {result.error}")
             
             col1, col2 = st.columns(2)
             
             with col1:
                 st.markdown("**✅ Reasons for Score:**")
-                for reason in result.get("reasons", []):
+                for reason in result.reasons:
                     st.write(f"• {reason}")
                 
-                if result.get("matches"):
+                if result.matches:
                     st.markdown("**🎯 Key Matches:**")
-                    for match in result["matches"][:5]:
+                    for match in result.matches[:5]:
                         st.write(f"• {match}")
             
             with col2:
-                if result.get("gaps"):
+                if result.gaps:
                     st.markdown("**⚠️ Gaps Identified:**")
-                    for gap in result["gaps"][:5]:
+                    for gap in result.gaps[:5]:
                         st.write(f"• {gap}")
                 
-                if result.get("suggestions") and result["score"] < 50:
+                if result.suggestions and result.score < 50:
                     st.markdown("**💡 Suggestions:**")
-                    for suggestion in result["suggestions"]:
+                    for suggestion in result.suggestions:
                         st.write(f"• {suggestion}")
     
     # Download results
     st.divider()
     st.subheader("💾 Export Results")
     
-    json_data = json.dumps(results, indent=2)
+    json_data = json.dumps(results_df.to_dict(orient="records"), indent=2)
     
     st.download_button(
         label="📥 Download JSON Report",
@@ -0,0 +1,22 @@
+"""
+Caching helpers shared by the chains and the workflow.
+"""
+from functools import lru_cache
+
+try:
+    import streamlit as st
+    from streamlit import runtime
+except ImportError:
+    st = None
+
+
+def cache_resource(func):
+    """
+    Cache a heavy shared object (client, compiled graph) for the process.
+    
+    Inside a running Streamlit app this is st.cache_resource, so the object
+    survives script reruns; elsewhere (tests, scripts) it is an lru_cache.
+    """
+    if st is not None and runtime.exists():
+        return st.cache_resource(show_spinner=False, max_entries=1)(func)
+    return lru_cache(maxsize=1)(func)
@@ -1,157 +1,384 @@
 """
 LangChain chains for resume screening operations.
 """
+from langchain_core.exceptions import OutputParserException
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
 from langchain_google_genai import ChatGoogleGenerativeAI
-from typing import Dict, Any
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel, Field
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+import copy
+import hashlib
+import json
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
+from caching import cache_resource
 
 # Load environment variables at module import
 load_dotenv()
 
+# Max LLM responses kept in memory; responses are never written to disk
+RESPONSE_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
 
-def get_llm():
-    """Initialize Gemini LLM with lazy loading."""
+# Seconds a cached response stays valid, so model or prompt drift does not linger
+RESPONSE_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+
+# key -> (time stored, response), least recently used first
+_response_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Cap on in-flight Gemini requests so a large thread pool cannot trigger 429s
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+_llm_semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Rate limiting and transient server errors worth retrying
+_RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Resume text sent to the LLM is capped at roughly 4k tokens
+RESUME_MAX_CHARS = int(os.getenv("RESUME_MAX_CHARS", "16000"))
+
+_PAGE_MARKER_RE = re.compile(r"^\s*page\s+\d+(\s+of\s+\d+)?\s*$", re.IGNORECASE | re.MULTILINE)
+_URL_LINE_RE = re.compile(r"^\s*(https?://|www\.)\S+\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def _get_api_key() -> str:
+    """Read the Gemini API key, which the Streamlit sidebar may update at runtime."""
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("GOOGLE_API_KEY not found in environment variables. Please add it to your .env file or enter it in the Streamlit sidebar.")
-    
+    return api_key
+
+
+@cache_resource
+def _llm(api_key: str) -> ChatGoogleGenerativeAI:
+    """Build the Gemini LLM once per API key."""
     return ChatGoogleGenerativeAI(
         model="gemini-2.5-flash",
         google_api_key=api_key,
         temperature=0.3,
-        convert_system_message_to_human=True
+        # Retries are handled by _invoke_with_retry; 1 disables the SDK's own
+        max_retries=1
     )
 
 
-# Define prompts (without LLM initialization)
-extraction_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are an expert resume parser. Extract key information from the resume text and return it as JSON.
+def get_llm():
+    """Return the shared Gemini LLM, rebuilding it only when the API key changes."""
+    return _llm(_get_api_key())
+
+
+class Experience(BaseModel):
+    """A single work experience entry."""
+    company: str = Field(description="Company name")
+    role: str = Field(description="Job title")
+    duration: str = Field(description="Time spent in the role, e.g. '3 years'")
+
+
+class Education(BaseModel):
+    """A single educational qualification."""
+    degree: str = Field(description="Degree name")
+    institution: str = Field(description="School or university name")
+
+
+class ResumeExtraction(BaseModel):
+    """Structured data extracted from a resume."""
+    skills: List[str] = Field(description="Technical and professional skills")
+    experience: List[Experience] = Field(description="Work experiences")
+    education: List[Education] = Field(description="Educational qualifications")
+
+
+class MatchResult(BaseModel):
+    """How a candidate lines up against the job description."""
+    matches: List[str] = Field(description="Skills, experience and education that align with the JD")
+    gaps: List[str] = Field(description="Requirements from the JD the candidate is missing")
+
+
+class ScoreResult(BaseModel):
+    """Candidate fit score with its justification."""
+    score: int = Field(ge=0, le=100, description="Fit for the job, 0-100")
+    reasons: List[str] = Field(description="3-5 concise reasons for the score")
+    suggestions: List[str] = Field(description="3-5 concise improvement suggestions")
+
+
+class ScreeningResult(ResumeExtraction, MatchResult, ScoreResult):
+    """Extraction, matching and scoring for one resume."""
 
-Extract the following:
+
+class BatchScreeningItem(ScreeningResult):
+    """Screening for one resume within a batch."""
+    resume_index: int = Field(description="Number shown in the resume's header")
+
+
+class BatchScreeningResult(BaseModel):
+    """Screenings for every resume in a batch."""
+    results: List[BatchScreeningItem] = Field(description="One entry per resume")
+
+
+# Define prompts (without LLM initialization); output shape comes from the schemas above
+screening_prompt = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert resume parser and recruiter. Screen the candidate's resume against the job description in a single pass.
+
+1. Extract from the resume:
 - skills: List of technical and professional skills
 - experience: List of work experiences with company, role, and duration
 - education: List of educational qualifications with degree and institution
 
-Return ONLY valid JSON in this exact format:
-{{
-    "skills": ["skill1", "skill2"],
-    "experience": [
-        {{"company": "Company Name", "role": "Job Title", "duration": "Years"}}
-    ],
-    "education": [
-        {{"degree": "Degree Name", "institution": "School Name"}}
-    ]
-}}"""),
-    ("human", "Resume text:\n{resume_text}")
-])
-
-matching_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are an expert recruiter. Compare the candidate's resume data to the job description.
+2. Compare the extracted data to the job description and identify:
+- matches: Matching qualifications (skills, experience, education that align)
+- gaps: Missing requirements from the JD
 
-Identify:
-1. Matching qualifications (skills, experience, education that align)
-2. Gaps (missing requirements from the JD)
+3. Score the candidate's fit for the job (0-100%), considering:
+- Skill alignment (40% weight)
+- Experience relevance (40% weight)
+- Education requirements (20% weight)
 
-Return ONLY valid JSON in this format:
-{{
-    "matches": ["match1", "match2"],
-    "gaps": ["gap1", "gap2"]
-}}"""),
+Provide 3-5 concise reasons and suggestions."""),
     ("human", """Job Description:
 {jd}
 
-Candidate Data:
-Skills: {skills}
-Experience: {experience}
-Education: {education}""")
+Resume text:
+{resume_text}""")
 ])
 
-scoring_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are an expert recruiter. Score the candidate's fit for the job (0-100%).
+batch_screening_prompt = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert resume parser and recruiter. Screen every resume below against the same job description, independently of one another.
 
-Consider:
+For each resume:
+1. Extract skills, experience (company, role, duration) and education (degree, institution)
+2. Identify matches (qualifications that align with the JD) and gaps (missing JD requirements)
+3. Score the candidate's fit for the job (0-100%), considering:
 - Skill alignment (40% weight)
 - Experience relevance (40% weight)
 - Education requirements (20% weight)
 
-Return ONLY valid JSON in this format:
-{{
-    "score": 75,
-    "reasons": [
-        "Strong match: 8/10 required skills present",
-        "Relevant experience in similar role",
-        "Gap: Missing certification X"
-    ],
-    "suggestions": ["Acquire skill Y", "Gain experience in Z"]
-}}
-
-Provide 3-5 concise reasons and suggestions."""),
+Return exactly one result per resume. resume_index must be the number shown in that resume's header. Provide 3-5 concise reasons and suggestions per resume."""),
     ("human", """Job Description:
 {jd}
 
-Matches:
-{matches}
+{resumes}""")
+])
+
 
-Gaps:
-{gaps}
+_PROMPTS = {
+    "screen": (screening_prompt, ScreeningResult),
+    "screen_batch": (batch_screening_prompt, BatchScreeningResult)
+}
+
+
+def _to_dict(result: BaseModel) -> Dict[str, Any]:
+    """Convert a validated structured-output model into a plain dict."""
+    return result.model_dump()
+
+
+@lru_cache(maxsize=len(_PROMPTS))
+def _build_chain(name: str, api_key: str) -> Runnable:
+    """Build a prompt | structured llm chain once per API key."""
+    prompt, schema = _PROMPTS[name]
+    structured_llm = _llm(api_key).with_structured_output(schema, method="json_schema")
+    return prompt | structured_llm | _to_dict
+
+
+def _chain(name: str) -> Runnable:
+    """Return the prebuilt chain for the given prompt name."""
+    return _build_chain(name, _get_api_key())
 
-Candidate Experience:
-{experience}""")
-])
 
+def _collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines."""
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text)
 
-def extract_resume_data(resume_text: str) -> Dict[str, Any]:
-    """Extract structured data from resume text."""
+
+def _drop_page_markers(text: str) -> str:
+    """Remove "Page N" / "Page N of M" lines."""
+    return _PAGE_MARKER_RE.sub("", text)
+
+
+def _drop_repeated_page_edges(text: str) -> str:
+    """Drop first/last lines of a page that repeat an earlier page's header/footer."""
+    pages = text.split("\f")
+    headers, footers = set(), set()
+    for i, page in enumerate(pages):
+        lines = page.split("\n")
+        content = [j for j, line in enumerate(lines) if line.strip()]
+        if not content:
+            continue
+        first, last = content[0], content[-1]
+        header, footer = lines[first].strip(), lines[last].strip()
+        drop = set()
+        if header in headers:
+            drop.add(first)
+        if footer in footers:
+            drop.add(last)
+        headers.add(header)
+        footers.add(footer)
+        pages[i] = "\n".join(line for j, line in enumerate(lines) if j not in drop)
+    return "\f".join(pages)
+
+
+def _drop_url_lines(text: str) -> str:
+    """Remove lines that hold nothing but a URL."""
+    return _URL_LINE_RE.sub("", text)
+
+
+# Cheapest and least lossy first; each pass runs only while still over budget
+_TRIM_PASSES = (_collapse_whitespace, _drop_page_markers, _drop_repeated_page_edges, _drop_url_lines)
+
+
+def _trim_resume(text: str, max_chars: int = RESUME_MAX_CHARS) -> str:
+    """
+    Cap resume text at max_chars before it is sent to the LLM.
+    
+    Short resumes pass through untouched. Longer ones go through the trim
+    passes one at a time (extra whitespace, "Page N of M" markers, headers
+    and footers repeated at page boundaries, URL-only lines), stopping as
+    soon as the text fits, and are only then truncated.
+    """
+    for trim in _TRIM_PASSES:
+        if len(text) <= max_chars:
+            return text
+        text = trim(text)
+    return text[:max_chars]
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """Check whether an error, or any error it wraps, is a 429 or 5xx."""
+    while error is not None:
+        code = getattr(error, "code", None)
+        if isinstance(code, int) and code in _RETRYABLE_STATUS_CODES:
+            return True
+        error = error.__cause__
+    return False
+
+
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+def _invoke_with_retry(name: str, inputs: Dict[str, Any]) -> Any:
+    """Invoke a chain, backing off on rate limits and transient server errors."""
+    with _llm_semaphore:
+        return _chain(name).invoke(inputs)
+
+
+def _cache_key(name: str, inputs: Dict[str, Any]) -> str:
+    """Hash the chain name and its exact inputs into a cache key."""
+    payload = json.dumps([name, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[Dict[str, Any]]:
+    """Return a copy of the unexpired cached response for key, or None."""
+    with _response_cache_lock:
+        if key in _response_cache:
+            stored_at, response = _response_cache[key]
+            if time.monotonic() - stored_at < RESPONSE_CACHE_TTL:
+                _response_cache.move_to_end(key)
+                return copy.deepcopy(response)
+            del _response_cache[key]
+    return None
+
+
+def _cache_put(key: str, response: Dict[str, Any]) -> None:
+    """Store a response, evicting expired entries and then the least recently used."""
+    with _response_cache_lock:
+        now = time.monotonic()
+        expired = [k for k, (stored_at, _) in _response_cache.items() if now - stored_at >= RESPONSE_CACHE_TTL]
+        for k in expired:
+            del _response_cache[k]
+        
+        _response_cache[key] = (now, copy.deepcopy(response))
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def _cached_invoke(name: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Invoke a chain, reusing the response for identical inputs (LRU with TTL, in memory)."""
+    key = _cache_key(name, inputs)
+    
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    
+    # Failures raise before this point, so errors are never cached
+    response = _invoke_with_retry(name, inputs)
+    _cache_put(key, response)
+    
+    return response
+
+
+def clear_response_cache() -> None:
+    """Drop all cached LLM responses."""
+    with _response_cache_lock:
+        _response_cache.clear()
+
+
+def screen_resume(jd: str, resume_text: str) -> Dict[str, Any]:
+    """Extract, match and score a resume against the JD with a single LLM call."""
     try:
-        # Create chain with lazy LLM initialization
-        chain = extraction_prompt | get_llm() | JsonOutputParser()
-        return chain.invoke({"resume_text": resume_text})
+        return _cached_invoke("screen", {"jd": jd, "resume_text": _trim_resume(resume_text)})
     except Exception as e:
         return {
             "skills": [],
             "experience": [],
             "education": [],
-            "error": str(e)
-        }
-
-
-def match_to_jd(jd: str, resume_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Match resume to job description."""
-    try:
-        # Create chain with lazy LLM initialization
-        chain = matching_prompt | get_llm() | JsonOutputParser()
-        return chain.invoke({
-            "jd": jd,
-            "skills": resume_data.get("skills", []),
-            "experience": resume_data.get("experience", []),
-            "education": resume_data.get("education", [])
-        })
-    except Exception as e:
-        return {
             "matches": [],
             "gaps": [],
+            "score": 0,
+            "reasons": ["Error in screening"],
+            "suggestions": [],
             "error": str(e)
         }
 
 
-def score_candidate(jd: str, resume_data: Dict[str, Any], match_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Score candidate fit."""
+def screen_resumes_batch(jd: str, resume_texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    Screen several resumes against the JD in one LLM call, sending the JD once.
+    
+    Each resume is cached under the same key as screen_resume, so only the
+    ones not already screened against this JD are sent, and a rerun with a
+    file added, removed or reordered still reuses the rest.
+    
+    Returns one screening dict per resume in input order, or an empty list if
+    the response is malformed or does not cover every resume exactly once.
+    Any other error (missing API key, auth failure, exhausted retries) is raised.
+    """
+    inputs = [{"jd": jd, "resume_text": _trim_resume(text)} for text in resume_texts]
+    keys = [_cache_key("screen", item) for item in inputs]
+    screenings = [_cache_get(key) for key in keys]
+    misses = [idx for idx, screening in enumerate(screenings) if screening is None]
+    
     try:
-        # Create chain with lazy LLM initialization
-        chain = scoring_prompt | get_llm() | JsonOutputParser()
-        return chain.invoke({
-            "jd": jd,
-            "matches": match_data.get("matches", []),
-            "gaps": match_data.get("gaps", []),
-            "experience": resume_data.get("experience", [])
-        })
-    except Exception as e:
-        return {
-            "score": 0,
-            "reasons": ["Error in scoring"],
-            "suggestions": [],
-            "error": str(e)
-        }
\ No newline at end of file
+        if len(misses) == 1:
+            screenings[misses[0]] = _cached_invoke("screen", inputs[misses[0]])
+        elif misses:
+            resumes = "\n\n".join(
+                f"=== Resume {number} ===\n{inputs[idx]['resume_text']}"
+                for number, idx in enumerate(misses, 1)
+            )
+            response = _invoke_with_retry("screen_batch", {"jd": jd, "resumes": resumes})
+            
+            items = response.get("results", [])
+            by_index = {
+                item["resume_index"]: {k: v for k, v in item.items() if k != "resume_index"}
+                for item in items
+            }
+            if len(items) != len(misses) or set(by_index) != set(range(1, len(misses) + 1)):
+                return []
+            
+            for number, idx in enumerate(misses, 1):
+                _cache_put(keys[idx], by_index[number])
+                screenings[idx] = by_index[number]
+    except OutputParserException:
+        return []
+    
+    return screenings
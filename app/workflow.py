@@ -1,18 +1,39 @@
 """
 LangGraph workflow for resume screening.
 """
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, Optional, Tuple, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from langgraph.graph import StateGraph, END
-from langchain_community.document_loaders import PyPDFLoader
-import tempfile
+import pymupdf
+import hashlib
+import logging
+import multiprocessing
 import os
-from chains import extract_resume_data, match_to_jd, score_candidate
+import threading
+from chains import screen_resume, screen_resumes_batch
+from caching import cache_resource
+
+# Upper bound on resumes screened concurrently; tune to your Gemini quota
+DEFAULT_MAX_WORKERS = int(os.getenv("SCREENING_MAX_WORKERS", "8"))
+
+# Resumes sent per batched LLM call; small chunks let results stream in as each call returns
+SCREENING_BATCH_SIZE = int(os.getenv("SCREENING_BATCH_SIZE", "3"))
+
+# Processes used to extract PDF text in parallel; 1 (the default) disables the pool.
+# Only raise it where the container really has spare cores and memory per worker.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+
+logger = logging.getLogger(__name__)
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
+_extract_pool_lock = threading.Lock()
 
 
 class ScreeningState(TypedDict):
     """State for the screening workflow."""
     jd: str
-    resume_file_path: str
+    resume_bytes: bytes
     resume_text: str
     resume_data: Dict[str, Any]
     match_data: Dict[str, Any]
@@ -23,111 +44,136 @@ class ScreeningState(TypedDict):
     error: str
 
 
-def load_resume(state: ScreeningState) -> ScreeningState:
-    """Load and extract text from resume PDF."""
+def extract_text_from_bytes(pdf_bytes: bytes) -> str:
+    """Extract the text of every page from an in-memory PDF, pages separated by form feeds."""
+    # The context manager closes the document even if a page fails to parse
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return "\f".join(page.get_text() for page in doc)
+
+
+def read_resume(pdf_bytes: bytes) -> Tuple[str, str]:
+    """Return (resume_text, error) for a resume PDF; error is empty on success."""
     try:
-        loader = PyPDFLoader(state["resume_file_path"])
-        pages = loader.load()
-        resume_text = "\n".join([page.page_content for page in pages])
-        
-        if not resume_text.strip():
-            state["error"] = "Empty PDF or failed to extract text"
-            state["resume_text"] = ""
-        else:
-            state["resume_text"] = resume_text
-            state["error"] = ""
-            
+        resume_text = extract_text_from_bytes(pdf_bytes)
     except Exception as e:
-        state["error"] = f"PDF loading error: {str(e)}"
-        state["resume_text"] = ""
+        return "", f"PDF loading error: {str(e)}"
     
-    return state
+    if not resume_text.strip():
+        return "", "Empty PDF or failed to extract text"
+    
+    return resume_text, ""
 
 
-def extract_data(state: ScreeningState) -> ScreeningState:
-    """Extract structured data from resume."""
-    if state.get("error"):
-        return state
-    
-    try:
-        resume_data = extract_resume_data(state["resume_text"])
-        state["resume_data"] = resume_data
-        
-        if "error" in resume_data:
-            state["error"] = f"Extraction error: {resume_data['error']}"
-            
-    except Exception as e:
-        state["error"] = f"Data extraction error: {str(e)}"
-        state["resume_data"] = {}
+def _get_extract_pool() -> ProcessPoolExecutor:
+    """Return the process pool for PDF extraction, created once and shared across runs."""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            # Spawn, not fork: the Streamlit server is multi-threaded
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extract_pool
+
+
+def _reset_extract_pool() -> None:
+    """Discard a broken extraction pool so the next run starts a fresh one."""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is not None:
+            _extract_pool.shutdown(wait=False, cancel_futures=True)
+            _extract_pool = None
+
+
+def read_resumes(pdfs: List[bytes]) -> List[Tuple[str, str]]:
+    """Extract text from several PDFs, spreading the CPU work over processes when enabled."""
+    if min(os.cpu_count() or 1, PDF_EXTRACT_WORKERS, len(pdfs)) > 1:
+        try:
+            # Processes rather than threads: page iteration holds the GIL
+            return list(_get_extract_pool().map(read_resume, pdfs))
+        except (OSError, BrokenProcessPool) as e:
+            # e.g. process creation not permitted or a worker was killed
+            logger.warning("PDF extraction pool failed (%s); extracting serially", e)
+            _reset_extract_pool()
     
+    return [read_resume(pdf) for pdf in pdfs]
+
+
+def _mark_failed(state: ScreeningState) -> ScreeningState:
+    """Zero the score of a resume whose processing already failed."""
+    state["score"] = 0
+    state["reasons"] = [f"Processing failed: {state['error']}"]
+    state["suggestions"] = []
     return state
 
 
-def match_jd(state: ScreeningState) -> ScreeningState:
-    """Match resume to job description."""
-    if state.get("error"):
-        return state
+def load_resume(state: ScreeningState) -> ScreeningState:
+    """Load and extract text from resume PDF, unless it was already extracted."""
+    if not state.get("resume_text"):
+        state["resume_text"], state["error"] = read_resume(state["resume_bytes"])
     
-    try:
-        match_data = match_to_jd(state["jd"], state["resume_data"])
-        state["match_data"] = match_data
-        
-        if "error" in match_data:
-            state["error"] = f"Matching error: {match_data['error']}"
-            
-    except Exception as e:
-        state["error"] = f"JD matching error: {str(e)}"
-        state["match_data"] = {}
+    if state["error"]:
+        _mark_failed(state)
     
     return state
 
 
-def score_candidate_node(state: ScreeningState) -> ScreeningState:
-    """Score the candidate."""
+def route_after_load(state: ScreeningState) -> str:
+    """Conditional edge: skip screening when the PDF could not be read."""
     if state.get("error"):
-        state["score"] = 0
-        state["reasons"] = [f"Processing failed: {state['error']}"]
-        state["suggestions"] = []
+        return "end"
+    return "screen"
+
+
+def _apply_screening(state: ScreeningState, screening: Dict[str, Any]) -> ScreeningState:
+    """Copy a combined screening response into the workflow state."""
+    state["resume_data"] = {
+        "skills": screening.get("skills", []),
+        "experience": screening.get("experience", []),
+        "education": screening.get("education", [])
+    }
+    state["match_data"] = {
+        "matches": screening.get("matches", []),
+        "gaps": screening.get("gaps", [])
+    }
+    state["score"] = screening.get("score", 0)
+    state["reasons"] = screening.get("reasons", [])
+    state["suggestions"] = screening.get("suggestions", [])
+    
+    # A failed screening's zero score says nothing about the candidate
+    if "error" in screening:
+        state["error"] = f"Screening error: {screening['error']}"
         return state
     
-    try:
-        score_data = score_candidate(
-            state["jd"],
-            state["resume_data"],
-            state["match_data"]
-        )
-        
-        state["score"] = score_data.get("score", 0)
-        state["reasons"] = score_data.get("reasons", [])
-        state["suggestions"] = score_data.get("suggestions", [])
-        
-        if "error" in score_data:
-            state["error"] = f"Scoring error: {score_data['error']}"
-            
-    except Exception as e:
-        state["error"] = f"Candidate scoring error: {str(e)}"
-        state["score"] = 0
-        state["reasons"] = [f"Scoring failed: {str(e)}"]
-        state["suggestions"] = []
+    # Low scores always come with something actionable
+    if state["score"] < 50 and not state["suggestions"]:
+        gaps = state["match_data"]["gaps"]
+        if gaps:
+            state["suggestions"] = [f"Develop skills/experience in: {gap}" for gap in gaps[:3]]
+        else:
+            state["suggestions"] = ["Consider gaining more relevant experience"]
     
     return state
 
 
-def should_suggest_improvements(state: ScreeningState) -> str:
-    """Conditional edge: check if score is low."""
-    if state.get("score", 0) < 50:
-        return "suggest"
-    return "end"
+def _fail_screening(state: ScreeningState, error: Exception) -> ScreeningState:
+    """Zero the score of a resume whose LLM screening raised."""
+    state["error"] = f"Candidate screening error: {str(error)}"
+    state["score"] = 0
+    state["reasons"] = [f"Screening failed: {str(error)}"]
+    state["suggestions"] = []
+    return state
 
 
-def suggest_improvements(state: ScreeningState) -> ScreeningState:
-    """Add improvement suggestions for low scores."""
-    if not state.get("suggestions"):
-        gaps = state.get("match_data", {}).get("gaps", [])
-        if gaps:
-            state["suggestions"] = [f"Develop skills/experience in: {gap}" for gap in gaps[:3]]
-        else:
-            state["suggestions"] = ["Consider gaining more relevant experience"]
+def screen_candidate(state: ScreeningState) -> ScreeningState:
+    """Extract, match and score the resume in one LLM round-trip."""
+    try:
+        screening = screen_resume(state["jd"], state["resume_text"])
+        _apply_screening(state, screening)
+    
+    except Exception as e:
+        _fail_screening(state, e)
     
     return state
 
@@ -138,38 +184,36 @@ def create_screening_workflow() -> StateGraph:
     
     # Add nodes
     workflow.add_node("load_resume", load_resume)
-    workflow.add_node("extract_data", extract_data)
-    workflow.add_node("match_jd", match_jd)
-    workflow.add_node("score_candidate", score_candidate_node)
-    workflow.add_node("suggest_improvements", suggest_improvements)
+    workflow.add_node("screen", screen_candidate)
     
     # Add edges
     workflow.set_entry_point("load_resume")
-    workflow.add_edge("load_resume", "extract_data")
-    workflow.add_edge("extract_data", "match_jd")
-    workflow.add_edge("match_jd", "score_candidate")
     
-    # Conditional edge based on score
+    # Unreadable PDFs end here, before any LLM call
     workflow.add_conditional_edges(
-        "score_candidate",
-        should_suggest_improvements,
+        "load_resume",
+        route_after_load,
         {
-            "suggest": "suggest_improvements",
+            "screen": "screen",
             "end": END
         }
     )
-    workflow.add_edge("suggest_improvements", END)
+    workflow.add_edge("screen", END)
     
     return workflow.compile()
 
 
-def process_resume(jd: str, resume_file_path: str, candidate_name: str) -> Dict[str, Any]:
-    """Process a single resume through the workflow."""
-    workflow = create_screening_workflow()
-    
-    initial_state: ScreeningState = {
+@cache_resource
+def get_compiled_workflow():
+    """Return the compiled workflow, built once and shared across resumes and reruns."""
+    return create_screening_workflow()
+
+
+def _initial_state(jd: str, resume_bytes: bytes, candidate_name: str) -> ScreeningState:
+    """Build the starting workflow state for one resume."""
+    return {
         "jd": jd,
-        "resume_file_path": resume_file_path,
+        "resume_bytes": resume_bytes,
         "resume_text": "",
         "resume_data": {},
         "match_data": {},
@@ -179,36 +223,183 @@ def process_resume(jd: str, resume_file_path: str, candidate_name: str) -> Dict[
         "candidate_name": candidate_name,
         "error": ""
     }
+
+
+def _to_result(state: ScreeningState) -> Dict[str, Any]:
+    """Convert a finished workflow state into a result row for the UI."""
+    return {
+        "candidate": state["candidate_name"],
+        "score": state.get("score", 0),
+        "reasons": state.get("reasons", []),
+        "suggestions": state.get("suggestions", []),
+        "matches": state.get("match_data", {}).get("matches", []),
+        "gaps": state.get("match_data", {}).get("gaps", []),
+        "error": state.get("error", "")
+    }
+
+
+def process_resume(
+    jd: str,
+    resume_bytes: bytes,
+    candidate_name: str,
+    resume_text: str = ""
+) -> Dict[str, Any]:
+    """Process a single resume through the workflow; pass resume_text if it was already extracted."""
+    initial_state = _initial_state(jd, resume_bytes, candidate_name)
+    initial_state["resume_text"] = resume_text
     
-    result = workflow.invoke(initial_state)
+    result = get_compiled_workflow().invoke(initial_state)
     
+    return _to_result(result)
+
+
+def _failed_result(candidate_name: str, error: Exception) -> Dict[str, Any]:
+    """Build a zero-score result for a resume that could not be processed."""
     return {
         "candidate": candidate_name,
-        "score": result.get("score", 0),
-        "reasons": result.get("reasons", []),
-        "suggestions": result.get("suggestions", []),
-        "matches": result.get("match_data", {}).get("matches", []),
-        "gaps": result.get("match_data", {}).get("gaps", []),
-        "error": result.get("error", "")
+        "score": 0,
+        "reasons": [f"Processing failed: {str(error)}"],
+        "suggestions": [],
+        "matches": [],
+        "gaps": [],
+        "error": str(error)
     }
 
 
-def process_multiple_resumes(jd: str, resume_files: List[tuple]) -> List[Dict[str, Any]]:
-    """Process multiple resumes."""
+def _read_states(jd: str, resume_files: List[tuple]) -> List[ScreeningState]:
+    """Extract every resume's text once and build its workflow state."""
+    texts = read_resumes([file_content for _, file_content in resume_files])
+    
+    states = []
+    for (file_name, file_content), (resume_text, error) in zip(resume_files, texts):
+        state = _initial_state(jd, file_content, file_name)
+        state["resume_text"], state["error"] = resume_text, error
+        if error:
+            _mark_failed(state)
+        states.append(state)
+    
+    return states
+
+
+def _screen_batch(states: List[ScreeningState]) -> bool:
+    """
+    Screen the given readable resumes with one batched LLM call.
+    
+    Returns False when the batched response is unusable, so the caller can
+    fall back to the per-resume workflow. If the call itself fails, every
+    resume in it is marked with that error instead.
+    """
+    try:
+        screenings = screen_resumes_batch(states[0]["jd"], [state["resume_text"] for state in states])
+    except Exception as e:
+        for state in states:
+            _fail_screening(state, e)
+        return True
+    
+    if not screenings:
+        return False
+    
+    for state, screening in zip(states, screenings):
+        _apply_screening(state, screening)
+    
+    return True
+
+
+def _screen_chunk(states: List[ScreeningState]) -> List[Dict[str, Any]]:
+    """Screen a chunk of readable resumes, batched when possible, returning results in order."""
+    if len(states) > 1 and _screen_batch(states):
+        return [_to_result(state) for state in states]
+    
     results = []
+    for state in states:
+        try:
+            results.append(process_resume(
+                state["jd"],
+                state["resume_bytes"],
+                state["candidate_name"],
+                state["resume_text"]
+            ))
+        except Exception as e:
+            # One bad resume must not abort the rest of the batch
+            results.append(_failed_result(state["candidate_name"], e))
+    return results
+
+
+def _iter_unique_screening(
+    jd: str,
+    resume_files: List[tuple],
+    max_workers: Optional[int] = None
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (index, result) pairs chunk by chunk, each chunk screened in one LLM call when possible."""
+    states = _read_states(jd, resume_files)
+    
+    pending = []
+    for idx, state in enumerate(states):
+        if state["error"]:
+            yield idx, _to_result(state)
+        else:
+            pending.append(idx)
     
-    for file_name, file_content in resume_files:
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = tmp_file.name
+    if not pending:
+        return
+    
+    chunks = [pending[i:i + SCREENING_BATCH_SIZE] for i in range(0, len(pending), SCREENING_BATCH_SIZE)]
+    workers = max(1, min(len(chunks), max_workers or DEFAULT_MAX_WORKERS))
+    
+    # LLM calls are network-bound, so threads overlap the Gemini round-trips
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            executor.submit(_screen_chunk, [states[idx] for idx in chunk]): chunk
+            for chunk in chunks
+        }
         
-        try:
-            result = process_resume(jd, tmp_path, file_name)
-            results.append(result)
-        finally:
-            # Clean up temp file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-    
-    return results
\ No newline at end of file
+        for future in as_completed(futures):
+            yield from zip(futures[future], future.result())
+    finally:
+        # If the caller stops iterating (e.g. a Streamlit rerun), drop queued chunks
+        # instead of blocking until every LLM call finishes
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_screening(
+    jd: str,
+    resume_files: List[tuple],
+    max_workers: Optional[int] = None
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (upload index, result) pairs, screening identical files only once."""
+    groups: Dict[str, List[int]] = {}
+    for idx, (_, file_content) in enumerate(resume_files):
+        digest = hashlib.blake2b(file_content, digest_size=16).hexdigest()
+        groups.setdefault(digest, []).append(idx)
+    
+    members = list(groups.values())
+    unique_files = [resume_files[indices[0]] for indices in members]
+    
+    for unique_idx, result in _iter_unique_screening(jd, unique_files, max_workers):
+        for idx in members[unique_idx]:
+            yield idx, {**result, "candidate": resume_files[idx][0]}
+
+
+def process_multiple_resumes_iter(
+    jd: str,
+    resume_files: List[tuple],
+    max_workers: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """Yield each resume's result as soon as it is ready, in completion order."""
+    for _, result in _iter_screening(jd, resume_files, max_workers):
+        yield result
+
+
+def process_multiple_resumes(
+    jd: str,
+    resume_files: List[tuple],
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Process multiple resumes and return their results in upload order."""
+    results: List[Dict[str, Any]] = [None] * len(resume_files)
+    
+    for idx, result in _iter_screening(jd, resume_files, max_workers):
+        results[idx] = result
+    
+    return results
@@ -9,6 +9,18 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.workflow import create_screening_workflow, ScreeningState
 
+
+def _make_pdf(text):
+    """Build a one-page PDF containing the given text."""
+    import pymupdf
+
+    doc = pymupdf.open()
+    doc.new_page().insert_text((72, 72), text)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+
 def test_workflow_creation():
     """Test that the workflow is created correctly."""
     workflow = create_screening_workflow()
@@ -24,7 +36,7 @@ def test_workflow_execution_mocked(mock_get_llm):
     # Create a simple state
     initial_state = {
         "jd": "Software Engineer required. Python skills needed.",
-        "resume_file_path": "dummy.pdf",
+        "resume_bytes": b"%PDF-1.4",
         "resume_text": "I know Python and have 5 years experience.",
         "resume_data": {"skills": ["Python"], "experience": []},
         "match_data": {"matches": ["Python"], "gaps": []},
@@ -46,7 +58,7 @@ def test_screening_state_structure():
     """Test that the ScreeningState TypedDict has the expected keys."""
     # This is a static check effectively
     expected_keys = {
-        "jd", "resume_file_path", "resume_text", "resume_data", 
+        "jd", "resume_bytes", "resume_text", "resume_data", 
         "match_data", "score", "reasons", "suggestions", "candidate_name", "error"
     }
     
@@ -55,7 +67,7 @@ def test_screening_state_structure():
     # but we can verify our state dictionary construction matches it.
     state = {
         "jd": "",
-        "resume_file_path": "",
+        "resume_bytes": b"",
         "resume_text": "",
         "resume_data": {},
         "match_data": {},
@@ -66,3 +78,430 @@ def test_screening_state_structure():
         "error": ""
     }
     assert set(state.keys()) == expected_keys
+
+@patch('app.workflow.process_resume')
+@patch('app.workflow.screen_resumes_batch', return_value=[])
+def test_process_multiple_resumes_isolates_failures(mock_batch, mock_process_resume):
+    """Test that a failing resume does not abort the batch and order is kept."""
+    from app.workflow import process_multiple_resumes
+
+    def fake_process(jd, resume_bytes, name, resume_text):
+        if name == "bad.pdf":
+            raise RuntimeError("boom")
+        return {"candidate": name, "score": 80}
+
+    mock_process_resume.side_effect = fake_process
+
+    results = process_multiple_resumes(
+        "JD",
+        [("a.pdf", _make_pdf("Alice")), ("bad.pdf", _make_pdf("Bad")), ("c.pdf", _make_pdf("Carol"))],
+        max_workers=2
+    )
+
+    assert [r["candidate"] for r in results] == ["a.pdf", "bad.pdf", "c.pdf"]
+    assert results[1]["score"] == 0
+    assert "boom" in results[1]["error"]
+
+@patch('app.workflow.screen_resume')
+def test_screen_candidate_splits_combined_response(mock_screen_resume):
+    """Test that the single screening call populates resume, match and score fields."""
+    from app.workflow import screen_candidate
+
+    mock_screen_resume.return_value = {
+        "skills": ["Python"],
+        "experience": [],
+        "education": [],
+        "matches": ["Python"],
+        "gaps": ["Kubernetes"],
+        "score": 72,
+        "reasons": ["Good fit"],
+        "suggestions": []
+    }
+
+    state = screen_candidate({
+        "jd": "Python developer",
+        "resume_text": "Python",
+        "error": ""
+    })
+
+    mock_screen_resume.assert_called_once_with("Python developer", "Python")
+    assert state["resume_data"]["skills"] == ["Python"]
+    assert state["match_data"] == {"matches": ["Python"], "gaps": ["Kubernetes"]}
+    assert state["score"] == 72
+    assert state["error"] == ""
+
+    # A failed screening keeps its error and gets no made-up suggestions
+    mock_screen_resume.return_value = {"score": 0, "reasons": ["Error in screening"], "error": "quota"}
+    state = screen_candidate({"jd": "Python developer", "resume_text": "Python", "error": ""})
+    assert state["error"] == "Screening error: quota"
+    assert state["suggestions"] == []
+
+def test_load_resume_reads_pdf_bytes():
+    """Test that resume text is extracted straight from in-memory PDF bytes."""
+    from app.workflow import load_resume
+
+    state = load_resume({"resume_bytes": _make_pdf("Python developer")})
+    assert "Python developer" in state["resume_text"]
+    assert state["error"] == ""
+
+    state = load_resume({"resume_bytes": b"not a pdf"})
+    assert state["resume_text"] == ""
+    assert state["error"]
+
+@patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"})
+def test_get_llm_is_reused_until_key_changes():
+    """Test that the Gemini client is built once and rebuilt on key change."""
+    from app.chains import get_llm
+
+    llm = get_llm()
+    assert get_llm() is llm
+
+    os.environ["GOOGLE_API_KEY"] = "other-key"
+    assert get_llm() is not llm
+
+@patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"})
+def test_chains_are_built_once():
+    """Test that each prompt chain is constructed once and then reused."""
+    from app.chains import _chain
+
+    assert _chain("screen") is _chain("screen")
+    assert _chain("screen") is not _chain("screen_batch")
+
+@patch('app.chains._chain')
+def test_screen_resume_reuses_cached_response(mock_chain):
+    """Test that identical screening inputs hit the LLM only once."""
+    from app.chains import screen_resume, clear_response_cache
+
+    clear_response_cache()
+    mock_chain.return_value.invoke.return_value = {"score": 90, "reasons": []}
+
+    first = screen_resume("JD", "resume")
+    second = screen_resume("JD", "resume")
+    screen_resume("Other JD", "resume")
+
+    assert first == second == {"score": 90, "reasons": []}
+    assert mock_chain.return_value.invoke.call_count == 2
+
+    # Callers get their own copy, so mutating one cannot poison the cache
+    first["score"] = 0
+    assert screen_resume("JD", "resume")["score"] == 90
+
+
+@patch('app.chains._chain')
+def test_cached_responses_expire_after_ttl(mock_chain):
+    """Test that cached responses are evicted once older than the TTL."""
+    from app.chains import screen_resume, clear_response_cache, RESPONSE_CACHE_TTL, _response_cache
+
+    clear_response_cache()
+    mock_chain.return_value.invoke.return_value = {"score": 90}
+
+    with patch('app.chains.time.monotonic', return_value=1000.0):
+        screen_resume("JD", "resume")
+        screen_resume("JD", "resume")
+    assert mock_chain.return_value.invoke.call_count == 1
+
+    with patch('app.chains.time.monotonic', return_value=1000.0 + RESPONSE_CACHE_TTL):
+        screen_resume("JD", "resume")
+    assert mock_chain.return_value.invoke.call_count == 2
+    assert len(_response_cache) == 1
+
+
+@patch('app.chains._invoke_with_retry')
+def test_screen_resumes_batch_orders_by_resume_index(mock_invoke):
+    """Test that batched results are matched back to resumes by index."""
+    from app.chains import screen_resumes_batch, clear_response_cache
+
+    clear_response_cache()
+    mock_invoke.return_value = {"results": [
+        {"resume_index": 2, "score": 40},
+        {"resume_index": 1, "score": 90}
+    ]}
+    assert screen_resumes_batch("JD", ["a", "b"]) == [{"score": 90}, {"score": 40}]
+
+    # A response that does not cover every resume is rejected
+    clear_response_cache()
+    mock_invoke.return_value = {"results": [{"resume_index": 1, "score": 90}]}
+    assert screen_resumes_batch("JD", ["a", "b"]) == []
+
+    # So is one that fails to parse, but other errors propagate
+    from langchain_core.exceptions import OutputParserException
+    mock_invoke.side_effect = OutputParserException("bad json")
+    assert screen_resumes_batch("JD", ["a", "b"]) == []
+    mock_invoke.side_effect = ValueError("GOOGLE_API_KEY not found")
+    with pytest.raises(ValueError):
+        screen_resumes_batch("JD", ["a", "b"])
+
+
+@patch('app.chains._invoke_with_retry')
+def test_screen_resumes_batch_caches_each_resume(mock_invoke):
+    """Test that batched screenings are cached per resume, so reordered or extended uploads reuse them."""
+    from app.chains import screen_resumes_batch, screen_resume, clear_response_cache
+
+    clear_response_cache()
+    mock_invoke.side_effect = lambda name, inputs: {"results": [
+        {"resume_index": idx, "score": idx} for idx in range(1, inputs["resumes"].count("=== Resume") + 1)
+    ]}
+    screen_resumes_batch("JD", ["a", "b"])
+
+    # Only the two new resumes are sent, in a batch of their own
+    assert screen_resumes_batch("JD", ["c", "b", "a", "d"]) == [{"score": 1}, {"score": 2}, {"score": 1}, {"score": 2}]
+    name, inputs = mock_invoke.call_args.args
+    assert name == "screen_batch" and "c" in inputs["resumes"] and "a" not in inputs["resumes"]
+
+    # The single-resume path shares the same entries
+    assert screen_resume("JD", "b") == {"score": 2}
+    assert mock_invoke.call_count == 2
+
+@patch('app.workflow.process_resume')
+@patch('app.workflow.screen_resumes_batch')
+def test_process_multiple_resumes_uses_batch_call(mock_batch, mock_process_resume):
+    """Test that readable resumes share one batched call and bad PDFs still report."""
+    from app.workflow import process_multiple_resumes
+
+    mock_batch.return_value = [
+        {"score": 85, "matches": ["Python"], "gaps": []},
+        {"score": 30, "matches": [], "gaps": ["Go"]}
+    ]
+
+    results = process_multiple_resumes("JD", [
+        ("a.pdf", _make_pdf("Alice")),
+        ("broken.pdf", b"not a pdf"),
+        ("b.pdf", _make_pdf("Bob"))
+    ])
+
+    mock_batch.assert_called_once()
+    mock_process_resume.assert_not_called()
+    assert [r["candidate"] for r in results] == ["a.pdf", "broken.pdf", "b.pdf"]
+    assert results[0]["score"] == 85
+    assert results[1]["score"] == 0 and results[1]["error"]
+    assert results[1]["suggestions"] == []
+    assert results[2]["suggestions"] == ["Develop skills/experience in: Go"]
+
+
+@patch('app.workflow.process_resume')
+@patch('app.workflow.screen_resumes_batch')
+def test_batch_fallback_reuses_extracted_text(mock_batch, mock_process_resume):
+    """Test that an unusable batch response falls back without re-reading PDFs, and errors are reported."""
+    from app.workflow import process_multiple_resumes
+
+    files = [("a.pdf", _make_pdf("Alice")), ("b.pdf", _make_pdf("Bob"))]
+
+    mock_batch.return_value = []
+    mock_process_resume.side_effect = lambda jd, resume_bytes, name, resume_text: {"candidate": name, "text": resume_text}
+    results = process_multiple_resumes("JD", files)
+    assert "Alice" in results[0]["text"] and "Bob" in results[1]["text"]
+
+    # A failed call is reported on each resume rather than retried one by one
+    mock_process_resume.reset_mock()
+    mock_batch.side_effect = ValueError("GOOGLE_API_KEY not found")
+    results = process_multiple_resumes("JD", files)
+    mock_process_resume.assert_not_called()
+    assert all("GOOGLE_API_KEY" in r["error"] and r["score"] == 0 for r in results)
+
+@patch('app.workflow.SCREENING_BATCH_SIZE', 2)
+@patch('app.workflow.process_resume')
+@patch('app.workflow.screen_resumes_batch')
+def test_process_multiple_resumes_iter_batches_in_chunks(mock_batch, mock_process_resume):
+    """Test that resumes are screened in small batched calls, each yielding its own results."""
+    from app.workflow import process_multiple_resumes_iter
+
+    mock_batch.side_effect = lambda jd, texts: [{"score": 70} for _ in texts]
+    mock_process_resume.side_effect = lambda jd, resume_bytes, name, resume_text: {"candidate": name, "score": 50}
+
+    files = [(f"{name}.pdf", _make_pdf(name)) for name in ["Alice", "Bob", "Carol", "Dan", "Eve"]]
+    results = list(process_multiple_resumes_iter("JD", files))
+
+    assert sorted(len(c.args[1]) for c in mock_batch.call_args_list) == [2, 2]
+    mock_process_resume.assert_called_once()
+    assert sorted(r["candidate"] for r in results) == [name for name, _ in files]
+
+@patch('app.workflow.SCREENING_BATCH_SIZE', 1)
+@patch('app.workflow.process_resume')
+def test_abandoned_screening_cancels_queued_chunks(mock_process_resume):
+    """Test that closing the result iterator early stops scheduling further LLM calls."""
+    from app.workflow import process_multiple_resumes_iter
+
+    import time
+
+    def slow_process(jd, resume_bytes, name, resume_text):
+        time.sleep(0.05)
+        return {"candidate": name, "score": 60}
+
+    mock_process_resume.side_effect = slow_process
+
+    files = [(f"{idx}.pdf", _make_pdf(f"Candidate {idx}")) for idx in range(6)]
+    results = process_multiple_resumes_iter("JD", files, max_workers=1)
+    next(results)
+    results.close()
+
+    assert mock_process_resume.call_count < len(files)
+
+@patch('app.workflow.PDF_EXTRACT_WORKERS', 2)
+@patch('app.workflow.os.cpu_count', return_value=4)
+def test_read_resumes_keeps_order_across_processes(mock_cpu_count):
+    """Test that parallel extraction returns texts and errors in input order on a reused pool."""
+    from app.workflow import read_resumes, _get_extract_pool, _reset_extract_pool
+
+    pdfs = [_make_pdf("Alice"), b"not a pdf", _make_pdf("Bob")]
+    try:
+        results = read_resumes(pdfs)
+        pool = _get_extract_pool()
+        assert read_resumes(pdfs) == results
+        assert _get_extract_pool() is pool
+    finally:
+        _reset_extract_pool()
+
+    assert "Alice" in results[0][0] and results[0][1] == ""
+    assert results[1][0] == "" and results[1][1].startswith("PDF loading error")
+    assert "Bob" in results[2][0] and results[2][1] == ""
+
+
+@patch('app.workflow.PDF_EXTRACT_WORKERS', 2)
+@patch('app.workflow.os.cpu_count', return_value=4)
+@patch('app.workflow._get_extract_pool')
+def test_read_resumes_falls_back_when_pool_breaks(mock_pool, mock_cpu_count):
+    """Test that a broken pool is reset and extraction finishes serially."""
+    from concurrent.futures.process import BrokenProcessPool
+    from app.workflow import read_resumes
+
+    mock_pool.return_value.map.side_effect = BrokenProcessPool("worker killed")
+
+    with patch('app.workflow._reset_extract_pool') as mock_reset:
+        results = read_resumes([_make_pdf("Alice"), _make_pdf("Bob")])
+
+    mock_reset.assert_called_once()
+    assert "Alice" in results[0][0] and "Bob" in results[1][0]
+
+@patch('app.workflow.process_resume')
+@patch('app.workflow.screen_resumes_batch', return_value=[])
+def test_process_multiple_resumes_iter_yields_every_result(mock_batch, mock_process_resume):
+    """Test that the streaming variant yields one result per uploaded resume."""
+    from app.workflow import process_multiple_resumes_iter
+
+    mock_process_resume.side_effect = lambda jd, resume_bytes, name, resume_text: {"candidate": name, "score": 60}
+
+    results = list(process_multiple_resumes_iter("JD", [("a.pdf", _make_pdf("Alice")), ("b.pdf", _make_pdf("Bob"))]))
+
+    assert sorted(r["candidate"] for r in results) == ["a.pdf", "b.pdf"]
+
+@patch('app.chains._chain')
+def test_invoke_with_retry_retries_rate_limits(mock_chain):
+    """Test that 429s are retried while other errors fail immediately."""
+    from tenacity import wait_none
+    from app.chains import _invoke_with_retry
+
+    class RateLimited(Exception):
+        code = 429
+
+    invoke = _invoke_with_retry.retry_with(wait=wait_none())
+
+    mock_chain.return_value.invoke.side_effect = [RateLimited(), {"score": 70}]
+    assert invoke("screen", {}) == {"score": 70}
+    assert mock_chain.return_value.invoke.call_count == 2
+
+    mock_chain.return_value.invoke.reset_mock()
+    mock_chain.return_value.invoke.side_effect = ValueError("bad request")
+    with pytest.raises(ValueError):
+        invoke("screen", {})
+    assert mock_chain.return_value.invoke.call_count == 1
+
+def test_trim_resume_drops_boilerplate_before_truncating():
+    """Test that long resumes lose page markers and repeated footers first."""
+    from app.chains import _trim_resume
+
+    assert _trim_resume("Short resume", max_chars=100) == "Short resume"
+
+    page = "John Doe - john@example.com\nPython    developer\nPage 1 of 2\nhttps://example.com/cv\n\n\n\n"
+    trimmed = _trim_resume("\f".join([page] * 3), max_chars=60)
+
+    assert "Page 1" not in trimmed
+    assert "https://" not in trimmed
+    assert trimmed.count("John Doe") == 1
+    assert "Python developer" in trimmed
+    assert len(trimmed) <= 60
+
+
+def test_trim_resume_keeps_repeated_body_lines():
+    """Test that only page headers/footers are deduplicated, not body content or dates."""
+    from app.chains import _trim_resume
+
+    job = "Software Engineer\n09/2019 - 03/2021\n- Built REST APIs in Python\n"
+    pages = ["Jane Roe\n" + job + job + "jane@example.com", "Jane Roe\n" + job + "jane@example.com"]
+    text = "\f".join(pages)
+    trimmed = _trim_resume(text, max_chars=len(text) - 1)
+
+    assert trimmed.count("Jane Roe") == 1
+    assert trimmed.count("jane@example.com") == 1
+    assert trimmed.count("Software Engineer") == 3
+    assert trimmed.count("- Built REST APIs in Python") == 3
+    assert "09/2019" in trimmed
+
+    # Passes stop as soon as the text fits, so headers survive a small overrun
+    padded = "Jane Roe\n" + job + "   \f" + "Jane Roe\n" + job
+    assert _trim_resume(padded, max_chars=len(padded) - 3).count("Jane Roe") == 2
+
+@patch('app.workflow.process_resume')
+def test_process_multiple_resumes_screens_duplicates_once(mock_process_resume):
+    """Test that identical uploads share one screening under each filename."""
+    from app.workflow import process_multiple_resumes
+
+    mock_process_resume.side_effect = lambda jd, resume_bytes, name, resume_text: {"candidate": name, "score": 75}
+
+    same = _make_pdf("Same")
+    results = process_multiple_resumes("JD", [("a.pdf", same), ("copy of a.pdf", same)])
+
+    mock_process_resume.assert_called_once()
+    assert [r["candidate"] for r in results] == ["a.pdf", "copy of a.pdf"]
+    assert [r["score"] for r in results] == [75, 75]
+
+def test_compiled_workflow_is_shared():
+    """Test that the compiled workflow is built once and reused."""
+    from app.workflow import get_compiled_workflow
+
+    assert get_compiled_workflow() is get_compiled_workflow()
+
+
+def test_screening_schema_rejects_out_of_range_scores():
+    """Test that the structured-output schema enforces the 0-100 score range."""
+    from pydantic import ValidationError
+    from app.chains import ScreeningResult
+
+    fields = {
+        "skills": ["Python"],
+        "experience": [{"company": "Acme", "role": "Engineer", "duration": "2 years"}],
+        "education": [],
+        "matches": [],
+        "gaps": [],
+        "reasons": [],
+        "suggestions": []
+    }
+
+    assert ScreeningResult(score=80, **fields).model_dump()["experience"][0]["company"] == "Acme"
+    with pytest.raises(ValidationError):
+        ScreeningResult(score=120, **fields)
+
+@patch('app.workflow.screen_resume')
+def test_unreadable_pdf_skips_llm(mock_screen_resume):
+    """Test that a corrupt PDF ends the workflow before any LLM call."""
+    from app.workflow import process_resume
+
+    result = process_resume("JD", b"not a pdf", "broken.pdf")
+
+    mock_screen_resume.assert_not_called()
+    assert result["score"] == 0
+    assert result["reasons"][0].startswith("Processing failed: PDF loading error")
+    assert result["suggestions"] == []
+
+
+@patch('app.workflow.screen_resume')
+def test_readable_pdf_runs_full_workflow(mock_screen_resume):
+    """Test that a readable PDF is screened and low scores get suggestions."""
+    from app.workflow import process_resume
+
+    mock_screen_resume.return_value = {"score": 40, "matches": [], "gaps": ["Docker"]}
+
+    result = process_resume("JD", _make_pdf("Alice"), "alice.pdf")
+
+    mock_screen_resume.assert_called_once()
+    assert result["score"] == 40
+    assert result["suggestions"] == ["Develop skills/experience in: Docker"]